@@ -12,17 +12,15 @@ from urllib.parse import quote
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from fetch_card_text import CardFetcher, save_to_csv
-from fetch_voice_data import extract_voice_data
-import pandas as pd
-import time
+from fetch_voice_data import extract_voice_data_to_csv, get_session
 
 
 def main():
     """
     メイン処理:
     1. WikiWikiからカード一覧を取得
-    2. 各カードのボイスデータを抽出
-    3. 結果をCSVに保存
+    2. 各カードのボイスデータを抽出し、取得したものから順にCSVに保存
+       （中断や取得失敗があった場合は次回の実行で続きから再開）
     """
     # メンバー名とURLを設定
     member_name = "桂城泉"
@@ -40,7 +38,7 @@ def main():
 
     # ステップ1: カード一覧を取得
     print("\n[ステップ1] カード一覧を取得中...")
-    fetcher = CardFetcher(member_url)
+    fetcher = CardFetcher(member_url, session=get_session())
     cards = fetcher.fetch_cards()
 
     if not cards:
@@ -51,39 +49,15 @@ def main():
     print(f"\nカードリストをCSVに保存: {card_list_path}")
     save_to_csv(cards, card_list_path, member_name)
 
-    # ステップ2: CSVを読み込んでボイスデータを抽出
-    print("\n[ステップ2] ボイスデータを抽出中...")
-    print(f"CSVから読み込み: {card_list_path}")
-    df = pd.read_csv(card_list_path)
-
-    # 新しいカラムを初期化
-    df['入手時'] = ''
-    df['特訓時'] = ''
-    df['特訓1回目'] = ''
-    df['特訓2回目'] = ''
-    df['ライブ開始'] = ''
-    df['スキル発動'] = ''
-    df['スキル発動(クロスボイス)'] = ''
-    df['SP発動'] = ''
-
-    # 各カードのボイスデータを抽出
-    total = len(df)
-    for index, row in df.iterrows():
-        print(f"\n進行状況: {index + 1}/{total}")
-        url = row['リンク']
-        voice_data = extract_voice_data(url)
-
-        # データを更新
-        for key, value in voice_data.items():
-            df.at[index, key] = value
-
-        # サーバーに負荷をかけないよう待機
-        time.sleep(1)
-
-    # ステップ3: 結果を保存
-    print(f"\n[ステップ3] 結果を保存中...")
+    # ステップ2: CSVを読み込んでボイスデータを抽出し、取得したものから順に保存
+    print("\n[ステップ2] ボイスデータを抽出・保存中...")
     print(f"出力先: {output_path}")
-    df.to_csv(output_path, index=False, encoding='utf-8-sig')
+    total, failed = extract_voice_data_to_csv(card_list_path, output_path)
+
+    if failed:
+        print(f"\n{failed}件のカードのボイスデータを取得できませんでした")
+        print("もう一度実行すると、取得できなかったカードから再開します")
+        return
 
     print("\n" + "=" * 80)
     print("完了！")
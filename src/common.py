@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+各スクリプトで共有するHTMLパーサーとHTTPセッションの設定、リクエストのレート制限
+"""
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# lxml（C実装のパーサー）が使える場合は優先し、なければ標準のhtml.parserを使う
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# requests-cacheが使える場合は取得したページをSQLiteにキャッシュし、再実行時の通信を省く
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
+
+CACHE_NAME = '.cache/wikiwiki'
+CACHE_EXPIRE_AFTER = 24 * 3600
+
+
+def create_session() -> requests.Session:
+    """
+    WikiWikiへのアクセスに使うセッションを作成
+
+    requests-cacheが使える場合は全スクリプトで同じキャッシュを共有するCachedSessionを返す
+
+    Returns:
+        セッション
+    """
+    if requests_cache is not None:
+        return requests_cache.CachedSession(CACHE_NAME, expire_after=CACHE_EXPIRE_AFTER)
+    return requests.Session()
+
+
+class RateLimiter:
+    """ホストごとにリクエストの開始間隔を一定以上空けるためのレートリミッター"""
+
+    def __init__(self, rps):
+        """
+        Args:
+            rps: 同一ホストへの1秒あたりのリクエスト数の上限
+        """
+        self.interval = 1 / rps
+        self._next_ok = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host=''):
+        """
+        前回のリクエストから間隔が空くまで待機する
+
+        前回のリクエストから既に間隔が空いていれば待機しない
+        """
+        # 次の枠をロック内で予約し、待機自体はロックの外で行う
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_ok.get(host, now))
+            self._next_ok[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """実際に通信する直前にレートリミッターで待機するアダプター"""
+
+    def __init__(self, rate_limiter, **kwargs):
+        self.rate_limiter = rate_limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        # キャッシュから返す場合はアダプターまで到達しないので待機しない
+        self.rate_limiter.wait(urlsplit(request.url).netloc)
+        return super().send(request, **kwargs)
@@ -5,25 +5,43 @@ WikiWikiページから藤島慈の実装カード一覧を取得するスクリ
 """
 
 import csv
+import functools
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from typing import List, Dict, Optional
 from urllib.parse import quote
 
+from common import HTML_PARSER, create_session
+
+
+# カード詳細ページのURLの共通部分
+_CARD_BASE_URL = "https://wikiwiki.jp/llll_wiki/"
+
+# 実装カード一覧の表に含まれるヘッダー
+# 必須ヘッダーが全てあり、任意ヘッダーのいずれかがあれば実装カード一覧とみなす
+_REQUIRED_HEADERS = frozenset({'レアリティ', 'カード名'})
+_OPTIONAL_HEADERS = frozenset({'初出ガチャ', 'スマイル', 'ピュア', 'クール'})
+
+# カード一覧の検索に必要なテーブルと見出しだけをパースする
+_CARD_PAGE_STRAINER = SoupStrainer(['table', 'h2', 'h3', 'h4'])
+
 
 class CardFetcher:
     """カード情報を取得するクラス"""
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, session: Optional[requests.Session] = None):
         """
         Args:
             url: WikiWikiページのURL
+            session: 使用するセッション（省略時は新規に作成）
         """
         self.url = url
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        if session is None:
+            session = create_session()
+            session.headers.update({
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            })
+        self.session = session
 
     def fetch_page(self) -> Optional[BeautifulSoup]:
         """
@@ -36,18 +54,14 @@ class CardFetcher:
             response = self.session.get(self.url, timeout=30)
             response.raise_for_status()
 
-            # WikiWikiはShift_JISの可能性があるため、エンコーディングを適切に設定
+            # Content-Typeにcharsetがあればそれを使い、なければパーサーに
+            # <meta charset>などからバイト列のエンコーディングを判定させる
+            encoding = None
             if 'charset' in response.headers.get('Content-Type', ''):
-                response.encoding = response.encoding
-            else:
-                # Shift_JISを試す
-                try:
-                    response.encoding = 'shift_jis'
-                    _ = response.text  # デコードテスト
-                except:
-                    response.encoding = response.apparent_encoding
-
-            return BeautifulSoup(response.text, 'html.parser')
+                encoding = response.encoding
+
+            return BeautifulSoup(response.content, HTML_PARSER, from_encoding=encoding,
+                                 parse_only=_CARD_PAGE_STRAINER)
         except requests.RequestException as e:
             print(f"ページの取得に失敗しました: {e}")
             return None
@@ -68,17 +82,11 @@ class CardFetcher:
         for table in tables:
             # ヘッダー行を取得
             headers = table.find_all('th')
-            header_texts = [th.get_text(strip=True) for th in headers]
+            header_set = {th.get_text(strip=True) for th in headers}
 
             # 実装カード一覧の特徴的なヘッダーをチェック
             # 「レアリティ」「カード名」「初出ガチャ」などが含まれているか確認
-            required_headers = ['レアリティ', 'カード名']
-            optional_headers = ['初出ガチャ', 'スマイル', 'ピュア', 'クール']
-
-            has_required = all(h in header_texts for h in required_headers)
-            has_optional = any(h in header_texts for h in optional_headers)
-
-            if has_required and has_optional:
+            if _REQUIRED_HEADERS <= header_set and header_set & _OPTIONAL_HEADERS:
                 return table
 
             # または「実装カード一覧」という見出しの後のテーブルかチェック
@@ -102,35 +110,24 @@ class CardFetcher:
         """
         cards = []
 
-        # ヘッダー行を取得
-        headers = []
-        header_row = table.find('tr')
-        if header_row:
-            for th in header_row.find_all(['th', 'td']):
-                headers.append(th.get_text(strip=True))
+        # 全行のセルのテキストを一度に取り出す
+        rows = [
+            [cell.get_text(strip=True) for cell in row.find_all(['th', 'td'])]
+            for row in table.find_all('tr')
+        ]
 
+        # 先頭行をヘッダーとして扱う
+        headers = rows[0] if rows else []
         if not headers:
             print("ヘッダーが見つかりませんでした")
             return cards
 
         print(f"検出されたヘッダー: {headers}")
 
-        # データ行を処理
-        rows = table.find_all('tr')[1:]  # ヘッダー行をスキップ
-        for row in rows:
-            cells = row.find_all(['td', 'th'])
-            if len(cells) == 0:
-                continue
-
-            card_data = {}
-            for i, cell in enumerate(cells):
-                if i < len(headers):
-                    header = headers[i]
-                    value = cell.get_text(strip=True)
-                    card_data[header] = value
-
-            if card_data:
-                cards.append(card_data)
+        # データ行を処理（ヘッダーより多いセルは無視する）
+        for cells in rows[1:]:
+            if cells:
+                cards.append(dict(zip(headers, cells)))
 
         return cards
 
@@ -161,10 +158,13 @@ class CardFetcher:
         return cards
 
 
+@functools.lru_cache(maxsize=None)
 def generate_card_link(card_name: str, member_name: str = "藤島慈") -> str:
     """
     カード詳細ページへのリンクを生成
 
+    同じ引数での呼び出し結果はキャッシュして再利用する
+
     Args:
         card_name: カード名
         member_name: メンバー名（デフォルトは「藤島慈」）
@@ -172,15 +172,29 @@ def generate_card_link(card_name: str, member_name: str = "藤島慈") -> str:
     Returns:
         カード詳細ページのURL
     """
-    base_url = "https://wikiwiki.jp/llll_wiki/"
-
     # カード名内の半角記号を全角に変換
     card_name_converted = card_name.replace('/', '／')
 
     # カード名を全角[]で囲み、メンバー名を追加してURLエンコード
-    page_name = f"［{card_name_converted}］{member_name}"
-    encoded_name = quote(page_name.encode('utf-8'))
-    return base_url + encoded_name
+    # quoteは1文字ずつエンコードするので、メンバー名側はエンコード済みのものを連結する
+    encoded_prefix = quote(f"［{card_name_converted}".encode('utf-8'))
+    return _CARD_BASE_URL + encoded_prefix + _encode_member_suffix(member_name)
+
+
+@functools.lru_cache(maxsize=None)
+def _encode_member_suffix(member_name: str) -> str:
+    """
+    カード詳細ページ名の末尾（「］」＋メンバー名）をURLエンコード
+
+    メンバー名はカードごとに変わらないため、一度だけエンコードして再利用する
+
+    Args:
+        member_name: メンバー名
+
+    Returns:
+        URLエンコード済みの文字列
+    """
+    return quote(f"］{member_name}".encode('utf-8'))
 
 
 def save_to_csv(cards: List[Dict[str, str]], output_path: str, member_name: str = "藤島慈"):
@@ -193,26 +207,17 @@ def save_to_csv(cards: List[Dict[str, str]], output_path: str, member_name: str
         member_name: メンバー名
     """
     with open(output_path, 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['メンバー', 'レアリティ', 'カード名', 'リンク']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-        writer.writeheader()
+        writer = csv.writer(csvfile)
 
-        for card in cards:
-            card_name = card.get('カード名', '')
-            rarity = card.get('レアリティ', '')
+        writer.writerow(['メンバー', 'レアリティ', 'カード名', 'リンク'])
 
-            if not card_name:
-                continue
-
-            link = generate_card_link(card_name, member_name)
-
-            writer.writerow({
-                'メンバー': member_name,
-                'レアリティ': rarity,
-                'カード名': card_name,
-                'リンク': link
-            })
+        # カード名のないカードは除外し、列の順に並べたタプルとして書き込む
+        writer.writerows(
+            (member_name, card.get('レアリティ', ''), card_name,
+             generate_card_link(card_name, member_name))
+            for card in cards
+            if (card_name := card.get('カード名', ''))
+        )
 
     print(f"CSVファイルを保存しました: {output_path}")
 
@@ -1,92 +1,298 @@
-import pandas as pd
-import requests
+import csv
+import os
 from bs4 import BeautifulSoup
-import time
+from concurrent.futures import ThreadPoolExecutor
 import re
 
+from common import HTML_PARSER, RateLimitedAdapter, RateLimiter, create_session
+
+
+# selectolax（lexborバインディング）が使える場合、ボイスの表の抽出はBeautifulSoupを使わずに行う
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+
+# 出力CSVに追加するボイスの列（この順で出力する）
+VOICE_COLUMNS = (
+    '入手時',
+    '特訓時',
+    '特訓1回目',
+    '特訓2回目',
+    'ライブ開始',
+    'スキル発動',
+    'スキル発動(クロスボイス)',
+    'SP発動',
+)
+
+# ボイスの種類（表の1列目）に含まれる文字列と格納先のキーの対応。上にあるものほど優先する
+_VOICE_TYPES = (
+    ('入手時', '入手時'),
+    ('特訓1回目', '特訓1回目'),
+    ('特訓2回目', '特訓2回目'),
+    ('特訓時', '特訓時'),
+    ('ライブ開始', 'ライブ開始'),
+    ('スキル発動(クロスボイス)', 'クロスボイス'),
+    ('SP発動', 'SP発動'),
+    ('SP発動', 'SP スキル発動'),
+    ('スキル発動', 'スキル発動'),
+)
+
+
+# 同時に取得するカード数の上限（サーバーへの負荷を抑えるため小さめにする）
+MAX_WORKERS = 4
+
+# 同一ホストへの1秒あたりのリクエスト数の上限
+REQUESTS_PER_SECOND = 1
+
+_RATE_LIMITER = RateLimiter(REQUESTS_PER_SECOND)
+
+
+# 同一ホストへの接続を使い回すため、モジュール全体で1つのセッションを共有する
+_SESSION = create_session()
+_SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+})
+# 同時に使う接続はワーカー数までなので、ホストごとの接続プールもその数に合わせる
+# pool_blockで上限を超える接続を作らせず、空いた接続が返るのを待って使い回す
+_SESSION.mount('https://', RateLimitedAdapter(_RATE_LIMITER, pool_maxsize=MAX_WORKERS,
+                                              pool_block=True))
+
+
+def get_session():
+    """ボイス取得で使用する共有セッションを返す"""
+    return _SESSION
+
+
+def _empty_voice():
+    """全てのボイスが空のボイスデータを返す"""
+    return dict.fromkeys(VOICE_COLUMNS, '')
+
+
+def _classify_voice_type(type_text):
+    """
+    ボイスの種類の文字列から格納先のキーを判定
+
+    Returns:
+        格納先のキー、どの種類にも当てはまらない場合はNone
+    """
+    for key, text in _VOICE_TYPES:
+        if text in type_text:
+            return key
+    return None
+
+
+def _find_voice_rows_selectolax(html):
+    """
+    selectolaxでHTMLから演出・ボイスの表の行を抽出
+
+    Returns:
+        (種類, セリフ)のリスト、演出・ボイスセクションがない場合はNone
+    """
+    tree = LexborHTMLParser(html)
+
+    # h2タグで「演出・ボイス」を探す
+    voice_section = None
+    for header in tree.css('h2, h3, h4'):
+        header_text = header.text()
+        if '演出' in header_text and 'ボイス' in header_text:
+            voice_section = header
+            break
+
+    if not voice_section:
+        return None
+
+    # 次のdivを探す
+    div = voice_section.next
+    while div is not None and div.tag != 'div':
+        div = div.next
+
+    rows = []
+    if div is not None:
+        # div内のテーブルを探す
+        table = div.css_first('table')
+        if table is not None:
+            for row in table.css('tr'):
+                cells = row.css('th, td')
+                if len(cells) >= 2:
+                    rows.append((cells[0].text().strip(), cells[1].text().strip()))
+    return rows
+
+
+def _find_voice_rows_bs4(html):
+    """
+    BeautifulSoupでHTMLから演出・ボイスの表の行を抽出
+
+    Returns:
+        (種類, セリフ)のリスト、演出・ボイスセクションがない場合はNone
+    """
+    soup = BeautifulSoup(html, HTML_PARSER, from_encoding='utf-8')
+
+    # h2タグで「演出・ボイス」を探す
+    headers = soup.find_all(['h2', 'h3', 'h4'])
+    voice_section = None
+
+    for header in headers:
+        if '演出' in header.get_text() and 'ボイス' in header.get_text():
+            voice_section = header
+            break
+
+    if not voice_section:
+        return None
+
+    # 次のdivを探す
+    rows = []
+    div = voice_section.find_next_sibling('div')
+    if div:
+        # div内のテーブルを探す
+        table = div.find('table')
+        if table:
+            for row in table.find_all('tr'):
+                cells = row.find_all(['th', 'td'])
+                if len(cells) >= 2:
+                    rows.append((cells[0].get_text().strip(), cells[1].get_text().strip()))
+    return rows
+
+
+def parse_voice_html(html, url=''):
+    """
+    カード詳細ページのHTMLから演出・ボイスセクションのデータを抽出
+
+    通信とは切り離し、バイト列を受け取って辞書を返すだけにしている
+
+    Args:
+        html: ページのHTML（バイト列）
+        url: ログに表示するページのURL
+    """
+    voice_data = _empty_voice()
+
+    # 演出・ボイスセクションの表の行を探す
+    if LexborHTMLParser is not None:
+        rows = _find_voice_rows_selectolax(html)
+    else:
+        rows = _find_voice_rows_bs4(html)
+
+    if rows is None:
+        print(f"  Warning: 演出・ボイス section not found for {url}")
+        return voice_data
+
+    for type_text, message_text in rows:
+        # 各カテゴリにマッチング
+        key = _classify_voice_type(type_text)
+        if key is None:
+            continue
+        # スキル発動は最初に出てきたものを採用する
+        if key == 'スキル発動' and voice_data[key]:
+            continue
+        voice_data[key] = message_text
+
+    print(f"  Extracted: {sum(1 for v in voice_data.values() if v)} voice entries")
+    return voice_data
+
 
 def extract_voice_data(url):
-    """URLから演出・ボイスセクションのデータを抽出"""
+    """
+    URLから演出・ボイスセクションのデータを抽出
+
+    Args:
+        url: カード詳細ページのURL
+
+    Returns:
+        ボイスデータ、ページの取得やパースに失敗した場合はNone
+        （演出・ボイスセクションがないページは全て空のボイスデータになる）
+    """
     try:
         print(f"Processing: {url}")
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=30)
-        response.encoding = 'utf-8'
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # 演出・ボイスセクションを探す
-        voice_data = {
-            '入手時': '',
-            '特訓時': '',
-            '特訓1回目': '',
-            '特訓2回目': '',
-            'ライブ開始': '',
-            'スキル発動': '',
-            'スキル発動(クロスボイス)': '',
-            'SP発動': ''
-        }
-
-        # h2タグで「演出・ボイス」を探す
-        headers = soup.find_all(['h2', 'h3', 'h4'])
-        voice_section = None
-
-        for header in headers:
-            if '演出' in header.get_text() and 'ボイス' in header.get_text():
-                voice_section = header
-                break
-
-        if not voice_section:
-            print(f"  Warning: 演出・ボイス section not found for {url}")
-            return voice_data
-
-        # 次のdivを探す
-        div = voice_section.find_next_sibling('div')
-        if div:
-            # div内のテーブルを探す
-            table = div.find('table')
-            if table:
-                rows = table.find_all('tr')
-                for row in rows:
-                    cells = row.find_all(['th', 'td'])
-                    if len(cells) >= 2:
-                        type_text = cells[0].get_text().strip()
-                        message_text = cells[1].get_text().strip()
-
-                        # 各カテゴリにマッチング
-                        if '入手時' in type_text:
-                            voice_data['入手時'] = message_text
-                        elif '特訓1回目' in type_text:
-                            voice_data['特訓1回目'] = message_text
-                        elif '特訓2回目' in type_text:
-                            voice_data['特訓2回目'] = message_text
-                        elif '特訓時' in type_text:
-                            voice_data['特訓時'] = message_text
-                        elif 'ライブ開始' in type_text:
-                            voice_data['ライブ開始'] = message_text
-                        elif 'クロスボイス' in type_text:
-                            voice_data['スキル発動(クロスボイス)'] = message_text
-                        elif 'スキル発動' in type_text and not voice_data['スキル発動']:
-                            voice_data['スキル発動'] = message_text
-                        elif 'SP発動' in type_text or 'SP スキル発動' in type_text:
-                            voice_data['SP発動'] = message_text
-
-        print(f"  Extracted: {sum(1 for v in voice_data.values() if v)} voice entries")
-        return voice_data
+        response = _SESSION.get(url, timeout=30)
+        # 404や429、5xxのページを「セクションなし」として扱わないよう、失敗として扱う
+        response.raise_for_status()
+        return parse_voice_html(response.content, url)
 
     except Exception as e:
         print(f"  Error processing {url}: {e}")
-        return {
-            '入手時': '',
-            '特訓時': '',
-            '特訓1回目': '',
-            '特訓2回目': '',
-            'ライブ開始': '',
-            'スキル発動': '',
-            'スキル発動(クロスボイス)': '',
-            'SP発動': ''
-        }
+        return None
+
+
+def extract_voice_data_many(urls, max_workers=MAX_WORKERS):
+    """
+    複数のURLからボイスデータを並行して抽出
+
+    結果は入力したURLと同じ順序で返す。サーバーへの負荷を抑えるため、
+    同一ホストへのリクエストはREQUESTS_PER_SECONDを超えないよう間隔を空ける
+
+    Args:
+        urls: カード詳細ページのURL
+        max_workers: 同時に取得するカード数の上限
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(extract_voice_data, urls)
+
+
+def extract_voice_data_to_csv(csv_path, output_path):
+    """
+    カード一覧CSVの各カードのボイスデータを抽出し、1件ずつCSVに書き込む
+
+    取得中の結果は出力先に「.partial」を付けたファイルに書き込み、全カードの取得に
+    成功した時点で出力先に置き換える。取得に失敗したカードは書き込まないため、
+    中断や失敗があった場合は次回の実行で.partialから再開し、残りのカードだけを取得する。
+    再開した場合も、最終的な出力はカード一覧の順に並ぶ
+
+    Returns:
+        (カード一覧のカード数, 取得に失敗したカード数)
+    """
+    partial_path = output_path + '.partial'
+
+    print(f"Reading CSV from {csv_path}")
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        card_columns = reader.fieldnames or []
+        cards = list(reader)
+
+    # 前回の途中結果から取得済みのリンクを集める
+    done_links = set()
+    if os.path.exists(partial_path):
+        with open(partial_path, 'r', encoding='utf-8-sig', newline='') as f:
+            done_links = {row['リンク'] for row in csv.DictReader(f)}
+
+    pending = [card for card in cards if card['リンク'] not in done_links]
+    if done_links:
+        print(f"Resuming: skipping {len(cards) - len(pending)} cards already in {partial_path}")
+
+    # 取得済みの行があれば追記し、なければヘッダーから書き直す
+    failed = 0
+    mode = 'a' if done_links else 'w'
+    with open(partial_path, mode, encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=[*card_columns, *VOICE_COLUMNS],
+                                lineterminator='\n')
+        if mode == 'w':
+            writer.writeheader()
+
+        voice_results = extract_voice_data_many(card['リンク'] for card in pending)
+        for i, (card, voice_data) in enumerate(zip(pending, voice_results), 1):
+            print(f"Progress: {i}/{len(pending)}")
+            if voice_data is None:
+                failed += 1
+                continue
+            writer.writerow({**card, **voice_data})
+            f.flush()
+
+    if failed:
+        print(f"Failed to fetch {failed} cards. Run again to retry them (progress kept in {partial_path})")
+        return len(cards), failed
+
+    # 再開した場合は再取得したカードが末尾に追記されているため、カード一覧の順に並べ直す
+    if done_links:
+        with open(partial_path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = {row['リンク']: row for row in csv.DictReader(f)}
+        with open(partial_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=[*card_columns, *VOICE_COLUMNS],
+                                    lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(rows[card['リンク']] for card in cards)
+    os.replace(partial_path, output_path)
+
+    return len(cards), failed
 
 
 def extract_voice_text(element, voice_type):
@@ -127,35 +333,12 @@ def main():
     csv_path = f'data/card_link_{member_name}.csv'
     output_path = f'data/card_link_with_voices_{member_name}.csv'
 
-    # CSVを読み込む
-    print(f"Reading CSV from {csv_path}")
-    df = pd.read_csv(csv_path)
-
-    # 新しいカラムを初期化
-    df['入手時'] = ''
-    df['特訓時'] = ''
-    df['特訓1回目'] = ''
-    df['特訓2回目'] = ''
-    df['ライブ開始'] = ''
-    df['スキル発動'] = ''
-    df['スキル発動(クロスボイス)'] = ''
-    df['SP発動'] = ''
-
-    # 各行を処理
-    for index, row in df.iterrows():
-        url = row['リンク']
-        voice_data = extract_voice_data(url)
-
-        # データを更新
-        for key, value in voice_data.items():
-            df.at[index, key] = value
-
-        # サーバーに負荷をかけないよう待機
-        time.sleep(1)
-
-    # CSVに保存
-    print(f"\nSaving to {output_path}")
-    df.to_csv(output_path, index=False, encoding='utf-8-sig')
+    # 各行を並行して処理し、取得したものから順にCSVに書き込む
+    _, failed = extract_voice_data_to_csv(csv_path, output_path)
+    if failed:
+        print(f"\nNot saved to {output_path}: {failed} cards failed")
+        return
+    print(f"\nSaved to {output_path}")
     print("Done!")
 
 
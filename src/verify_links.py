@@ -7,7 +7,53 @@ CSVファイル内のカードリンクを検証するスクリプト
 import csv
 import requests
 import time
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Optional
+from urllib3.util.retry import Retry
+
+from common import RateLimitedAdapter, RateLimiter
+
+
+# 同一ホストへのリクエストの最小間隔（秒）のデフォルト
+DEFAULT_DELAY = 0.5
+
+# 一時的なサーバーエラーとして再試行するステータスコードと、その回数・待機時間
+_RETRY_STATUSES = frozenset({500, 502, 503, 504})
+_RETRY_TOTAL = 2
+_RETRY_BACKOFF = 0.3
+
+
+def _create_session(delay: float) -> requests.Session:
+    """
+    検証に使うセッションを作成
+
+    同一ホストへのリクエストは、再試行も含めてdelay秒以上の間隔を空ける
+
+    Args:
+        delay: 同一ホストへのリクエストの最小間隔（秒）、0以下なら間隔を空けない
+
+    Returns:
+        セッション
+    """
+    adapter_options = {
+        'pool_maxsize': 10,  # verify_all_linksのデフォルトのワーカー数に合わせる
+        # 接続の確立に失敗した場合のみアダプターで再試行する
+        # サーバーに届いたリクエストの再試行はレート制限を通すためverify_linkで行う
+        'max_retries': Retry(total=_RETRY_TOTAL, read=0, backoff_factor=_RETRY_BACKOFF),
+    }
+    if delay > 0:
+        adapter = RateLimitedAdapter(RateLimiter(1 / delay), **adapter_options)
+    else:
+        adapter = HTTPAdapter(**adapter_options)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    return session
+
+
+# verify_linkを単独で呼び出した場合に使う共有セッション
+_SESSION = _create_session(DEFAULT_DELAY)
 
 
 def load_csv(csv_path: str) -> List[Dict[str, str]]:
@@ -28,22 +74,36 @@ def load_csv(csv_path: str) -> List[Dict[str, str]]:
     return data
 
 
-def verify_link(url: str, timeout: int = 10) -> tuple[bool, int, str]:
+def verify_link(url: str, timeout: int = 10,
+                session: Optional[requests.Session] = None) -> tuple[bool, int, str]:
     """
     リンクが有効かどうかを検証
 
     Args:
         url: 検証するURL
         timeout: タイムアウト時間（秒）
+        session: 使用するセッション（省略時はモジュール共有のセッション）
 
     Returns:
         (成功フラグ, ステータスコード, エラーメッセージ)
     """
+    if session is None:
+        session = _SESSION
     try:
-        response = requests.head(url, timeout=timeout, allow_redirects=True)
-        # HEADメソッドが失敗した場合はGETを試す
-        if response.status_code >= 400:
-            response = requests.get(url, timeout=timeout, allow_redirects=True)
+        for attempt in range(_RETRY_TOTAL + 1):
+            if attempt:
+                time.sleep(_RETRY_BACKOFF * 2 ** (attempt - 1))
+
+            # 本文をダウンロードしないようHEADで確認する
+            response = session.head(url, timeout=timeout, allow_redirects=True)
+            # HEADメソッド自体が許可されていない場合のみGETを試す
+            # 404や403などはGETでも結果が変わらないのでそのまま扱う
+            if response.status_code == 405:
+                response = session.get(url, timeout=timeout, allow_redirects=True)
+
+            # 一時的なサーバーエラー以外は再試行しない
+            if response.status_code not in _RETRY_STATUSES:
+                break
 
         success = 200 <= response.status_code < 400
         return success, response.status_code, ""
@@ -51,13 +111,14 @@ def verify_link(url: str, timeout: int = 10) -> tuple[bool, int, str]:
         return False, 0, str(e)
 
 
-def verify_all_links(csv_path: str, delay: float = 0.5):
+def verify_all_links(csv_path: str, delay: float = DEFAULT_DELAY, max_workers: int = 10):
     """
-    CSV内の全リンクを検証
+    CSV内の全リンクを並行して検証
 
     Args:
         csv_path: CSVファイルのパス
-        delay: リクエスト間の待機時間（秒）
+        delay: 同一ホストへのリクエストの最小間隔（秒）
+        max_workers: 同時に検証するリンク数の上限
     """
     print(f"CSVファイルを読み込み中: {csv_path}")
     data = load_csv(csv_path)
@@ -69,29 +130,35 @@ def verify_all_links(csv_path: str, delay: float = 0.5):
         'error': []
     }
 
-    for i, row in enumerate(data, 1):
-        card_name = row.get('カード名', '')
-        rarity = row.get('レアリティ', '')
-        link = row.get('リンク', '')
-
-        print(f"[{i}/{len(data)}] {rarity} {card_name}")
-        print(f"  URL: {link}")
-
-        success, status_code, error_msg = verify_link(link)
-
-        if success:
-            print(f"  ✓ 成功 (ステータス: {status_code})")
-            results['success'].append(row)
-        elif status_code > 0:
-            print(f"  ✗ 失敗 (ステータス: {status_code})")
-            results['failed'].append({**row, 'status': status_code})
-        else:
-            print(f"  ✗ エラー: {error_msg}")
-            results['error'].append({**row, 'error': error_msg})
-
-        # サーバーへの負荷を軽減するため待機
-        if i < len(data):
-            time.sleep(delay)
+    # 全ワーカーで1つのセッションを共有し、ホストごとのリクエスト間隔をdelay秒以上に保つ
+    session = _create_session(delay)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(verify_link, row.get('リンク', ''), session=session): row
+            for row in data
+        }
+
+        # 検証が完了した順に結果を表示
+        for i, future in enumerate(as_completed(futures), 1):
+            row = futures[future]
+            card_name = row.get('カード名', '')
+            rarity = row.get('レアリティ', '')
+            link = row.get('リンク', '')
+
+            print(f"[{i}/{len(data)}] {rarity} {card_name}")
+            print(f"  URL: {link}")
+
+            success, status_code, error_msg = future.result()
+
+            if success:
+                print(f"  ✓ 成功 (ステータス: {status_code})")
+                results['success'].append(row)
+            elif status_code > 0:
+                print(f"  ✗ 失敗 (ステータス: {status_code})")
+                results['failed'].append({**row, 'status': status_code})
+            else:
+                print(f"  ✗ エラー: {error_msg}")
+                results['error'].append({**row, 'error': error_msg})
 
     # 結果のサマリーを表示
     print("\n" + "=" * 80)
@@ -119,7 +186,7 @@ def verify_all_links(csv_path: str, delay: float = 0.5):
 def main():
     """メイン関数"""
     csv_path = "data/card_link.csv"
-    verify_all_links(csv_path, delay=0.5)
+    verify_all_links(csv_path, delay=DEFAULT_DELAY)
 
 
 if __name__ == "__main__":